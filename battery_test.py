@@ -16,11 +16,15 @@
 
 import dp8xx
 import sdl1030x
+import os
+import queue
+import threading
 import time
 import datetime
 import csv
 import traceback
 import tqdm
+from collections import deque, namedtuple
 
 # Battery parameters
 import spec_velo2_4v35 as spec
@@ -36,31 +40,125 @@ rest_discharge_to_charge = 60 * 5 # seconds
 # Misc calibration
 test_lead_resistance = 0.05 # measured by short circuiting the leads, putting a known current through, and measuring the voltage drop
 
+# How often to redraw the console status line. Redrawing every sample writes
+# ANSI escapes to the terminal once per second, which adds up over ssh.
+ui_update_interval = 5 # seconds
+
+# A single hung query shouldn't abort a run, but this many in a row means the
+# link is dead, not glitching: re-raise so the cycle fails and its finally
+# block de-energizes the hardware, rather than retrying forever with the
+# charger or load still on
+max_consecutive_timeouts = 5
+
+# Conversion factors, precomputed so the hot loops can use a single multiply
+# (one milliamp hour is 1/1000 of an amp for 3600 seconds; one coulomb is one
+# ampere-second)
+_MAH_TO_COULOMB = 3600.0 / 1000.0
+_COULOMB_TO_MAH = 1000.0 / 3600.0
+
+# The sampling loops keep their deadlines as integer nanoseconds from
+# time.monotonic_ns: integer compares are cheap, and unlike accumulating
+# floats they can't lose precision over a multi-hour run
+_NS_PER_S = 1_000_000_000
+
 def mah_to_coulombs(mah):
-    # one milliamp hour is 1/1000 of an amp for 3600 seconds
-    return mah / 1000 * 3600
+    return mah * _MAH_TO_COULOMB
 def coulombs_to_mah(coulombs):
-    # one coulomb is one ampere-second
-    return coulombs / 3600 * 1000
+    return coulombs * _COULOMB_TO_MAH
     
 # Misc configuration
 psu_ip = "10.0.0.10"
 load_ip = "10.0.0.11"
-
-def log_to_file(samples, filename):
-    fieldnames = samples[0].keys()
-    with open(filename, "w", newline='') as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        for sample in samples:
-            writer.writerow(sample)
+# One record per measurement. A namedtuple is much lighter than a fresh dict
+# per sample (no hash table per record) and iterates in field order, which is
+# exactly what the CSV writer needs. Rows that don't apply use '-' for
+# resistance, matching what postprocess_discharge.py expects.
+Sample = namedtuple("Sample", "time voltage current charge resistance status")
+
+
+class CsvLogger:
+    # Incremental CSV writer: the file is opened once per cycle and rows are
+    # appended as they arrive. All disk I/O happens on a background thread fed
+    # through a queue, so a slow flush (SD card, network share) can never
+    # stall the 1 Hz sampling loop - append is just a queue.put.
+
+    FLUSH_INTERVAL = 5 # seconds between flushes when samples trickle in
+    FLUSH_BATCH = 64 # rows that force a flush regardless of time
+
+    def __init__(self, filename, fields, fsync_on_flush=False):
+        # A 1 MiB buffer keeps write() syscalls rare for a 1 Hz telemetry log.
+        # fsync_on_flush trades that back for durability of each flush.
+        self._file = open(filename, "w", newline='', buffering=1024*1024)
+        self._fsync_on_flush = fsync_on_flush
+        # The field list is known up front (it's just the Sample fields), so
+        # write the header immediately - the file is well-formed even if the
+        # cycle dies before the first sample
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(fields)
+        self._queue = queue.Queue()
+        self._error = None
+        self._thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self._thread.start()
+
+    def append(self, sample):
+        # Hand the row to the writer thread; never blocks on disk. If the
+        # writer died (disk full, dead network share), surface its failure
+        # here rather than silently dropping rows into an undrained queue.
+        if self._error is not None:
+            raise self._error
+        self._queue.put(sample)
+
+    def _writer_loop(self):
+        pending = []
+        try:
+            while True:
+                try:
+                    sample = self._queue.get(timeout=self.FLUSH_INTERVAL)
+                except queue.Empty:
+                    self._flush(pending)
+                    continue
+                if sample is None: # Sentinel from close()
+                    self._flush(pending)
+                    return
+                pending.append(sample)
+                if len(pending) >= self.FLUSH_BATCH:
+                    self._flush(pending)
+        except Exception as e:
+            # Park the failure for append()/close() to re-raise on the main
+            # thread - a daemon thread dying on its own is invisible
+            self._error = e
+
+    def _flush(self, pending):
+        if pending:
+            self._writer.writerows(pending)
+            pending.clear()
+        self._file.flush()
+        if self._fsync_on_flush:
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join(timeout=10)
+        # Only close the file once the writer has actually stopped - closing
+        # underneath a wedged-but-running thread is a race
+        if not self._thread.is_alive():
+            self._file.close()
+        if self._error is not None:
+            raise self._error
 
 
 def charge_cycle(psu, fname):
 
     # TODO: Trickle charging when low voltage?
-    
+
     failed = False
+    logger = CsvLogger(fname, Sample._fields)
+
+    # Bind the clock functions to locals: a LOAD_FAST per call instead of
+    # LOAD_GLOBAL + LOAD_ATTR, which adds up in a loop that runs for hours
+    _monotonic_ns = time.monotonic_ns
+    _sleep = time.sleep
+    ui_interval_ns = ui_update_interval * _NS_PER_S
 
     try:
         # Charge with a constant-voltage, current limited to the charge rate
@@ -69,93 +167,143 @@ def charge_cycle(psu, fname):
         # The reason a relay is used is because the PSU has an approx 38mA leakage current in to its supply when off
         # which would affect the discharge measurements. 
         # This could alternatively be reduced to a ~1mA output by setting to 4.2v 0.0001A, but the relay guarantees 0 leakage.
-        psu.CH1.set_voltage(12) # Relay control voltage
-        psu.CH1.set_current(1)
-        psu.CH2.set_voltage(spec.charge_voltage)
-        psu.CH2.set_current(spec.charge_current)
+        # Configure both channels with one compound SCPI write: one round-trip
+        # instead of four, and no jitter between the individual settings
+        psu.write_many([
+            psu.CH1.cmd_set_voltage(12), # Relay control voltage
+            psu.CH1.cmd_set_current(1),
+            psu.CH2.cmd_set_voltage(spec.charge_voltage),
+            psu.CH2.cmd_set_current(spec.charge_current),
+        ])
   
         psu.CH1.set_output(True) # Power the relay
-        time.sleep(1) # Allow the relay to switch
+        _sleep(1) # Allow the relay to switch
         psu.CH2.set_output(True) # Turn on the charger output
-        start_time = time.time()
+        # Use the monotonic clock for all durations - the wall clock can step (NTP)
+        # which would corrupt the coulomb counting on a multi-hour run
+        start_ns = _monotonic_ns()
+        charge_deadline_ns = start_ns + 3 * 3600 * _NS_PER_S # Safety timeout, precomputed so the loop does one compare
         print(f"Charging begun, will log to {fname}")
 
-        samples = []
-        last_save_time = start_time
-        last_sample_time = start_time
+        last_sample_ns = start_ns
         estimated_charge = 0
 
         progbar = tqdm.tqdm(total=spec.nominal_capacity_mah, unit="mAh", unit_scale=True, desc="Charge starting...")
         progbar.update(0)
 
-        time.sleep(1) # Allow the PSU to start up before entering the loop
+        _sleep(1) # Allow the PSU to start up before entering the loop
+
+        next_tick_ns = _monotonic_ns() + _NS_PER_S
+        last_ui_update_ns = 0
+        consecutive_timeouts = 0
 
         # Monitor and log the voltage and current
         while True:
-            now = time.time()
-            dt = now - last_sample_time
-            last_sample_time = now
-
-            cur_values = psu.CH2.measure_all()
-            
-            voltage = cur_values['voltage']
-            current = cur_values['current']
+            now_ns = _monotonic_ns()
+            dt = (now_ns - last_sample_ns) * 1e-9 # Float delta is fine for coulomb counting
+            last_sample_ns = now_ns
+
+            try:
+                voltage, current, _ = psu.CH2.measure_all_tuple()
+                consecutive_timeouts = 0
+            except dp8xx.TIMEOUT_ERRORS:
+                # A hung query shouldn't abort a multi-hour run: log the gap
+                # so post-processing can see it, and retry next tick - unless
+                # the link has been dead for several ticks running
+                consecutive_timeouts += 1
+                if consecutive_timeouts >= max_consecutive_timeouts:
+                    raise
+                logger.append(Sample(time=(now_ns - start_ns) * 1e-9, voltage='-', current='-',
+                                     charge=estimated_charge, resistance='-', status="timeout"))
+                # The 3-hour safety timeout must still fire on this path: if
+                # the link is dead for good, skipping the check below would
+                # leave the charger energized indefinitely
+                if now_ns > charge_deadline_ns:
+                    print(f"\nTerminating charge due to timeout, charged for {(now_ns - start_ns) * 1e-9:.0f} seconds")
+                    break
+                sleep_for = (next_tick_ns - _monotonic_ns()) * 1e-9
+                if sleep_for > 0:
+                    _sleep(sleep_for)
+                    next_tick_ns += _NS_PER_S
+                else:
+                    next_tick_ns = _monotonic_ns() + _NS_PER_S
+                continue
+
             estimated_charge += current * dt
 
-            sample = {
-                'time': last_sample_time - start_time,
-                'voltage': voltage,
-                'current': current,
-                'charge': estimated_charge, 
-                'status': "charging"
-            }
-            samples.append(sample)
+            sample = Sample(
+                time=(now_ns - start_ns) * 1e-9,
+                voltage=voltage,
+                current=current,
+                charge=estimated_charge,
+                resistance='-',
+                status="charging"
+            )
+            logger.append(sample)
+
+            # Check termination before spending time on the UI, so the loop
+            # exits promptly once a stop condition is reached
 
-            # Show a status line and progress bar in the console
-            charge_mah = coulombs_to_mah(estimated_charge)            
-            progbar.n = min(charge_mah, spec.nominal_capacity_mah) # prevent the progress bar from going over the nominal capacity
-            progbar.set_description(f"Charging: {current*1000:.1f}mA, {voltage:.3f}V, {charge_mah:.1f}mAh")
-            
             # Terminate charge when current drops below the charge termination rate
             if current < spec.charge_termination_current:
-                print(f"\nTerminating charge due to cutoff current reached, charged for {time.time() - start_time} seconds")
+                print(f"\nTerminating charge due to cutoff current reached, charged for {(now_ns - start_ns) * 1e-9:.0f} seconds")
                 break
 
             # For safety, terminate charge after 3 hours regardless of current
-            if time.time() - start_time > 3 * 3600:
-                print(f"\nTerminating charge due to timeout, charged for {time.time() - start_time} seconds")
+            if now_ns > charge_deadline_ns:
+                print(f"\nTerminating charge due to timeout, charged for {(now_ns - start_ns) * 1e-9:.0f} seconds")
                 break
 
-            # Every minute, save the data to disk for later analysis
-            if time.time() - last_save_time > 60:
-                log_to_file(samples, fname)
-                last_save_time = time.time()
-
-            # There will be a small delay due to the time it takes to measure, serialise, and save the data.
-            # Aim for a 1-second delay between samples.
-            delay = 1 - (time.time() - last_sample_time)
-            if delay > 0:
-                time.sleep(delay)
-
-
-        psu.CH1.set_output(False) # Disconnect the relay
+            # Show a status line and progress bar in the console
+            charge_mah = estimated_charge * _COULOMB_TO_MAH
+            progbar.n = min(charge_mah, spec.nominal_capacity_mah) # prevent the progress bar from going over the nominal capacity
+            if now_ns - last_ui_update_ns >= ui_interval_ns:
+                progbar.set_description(f"Charging: {current*1000:.1f}mA, {voltage:.3f}V, {charge_mah:.1f}mAh", refresh=False)
+                progbar.refresh()
+                last_ui_update_ns = now_ns
+
+            # Sleep until the next scheduled tick. An absolute deadline keeps the
+            # 1 Hz cadence from drifting when a measurement or save overruns.
+            sleep_for = (next_tick_ns - _monotonic_ns()) * 1e-9
+            if sleep_for > 0:
+                _sleep(sleep_for)
+                next_tick_ns += _NS_PER_S
+            else:
+                # Fell behind (slow measurement, save or pulse): skip the
+                # missed ticks rather than bursting samples to catch up
+                next_tick_ns = _monotonic_ns() + _NS_PER_S
+
+
+        # Disconnect the relay and zero the charger in one round-trip
         #psu.CH2.set_output(False)
-        psu.CH2.set_current(0) # Temporary workaround for the PSU leakage current issue
+        psu.write_many([
+            psu.CH1.cmd_set_output(False),
+            psu.CH2.cmd_set_current(0), # Temporary workaround for the PSU leakage current issue
+        ])
         print("\nCharge complete")
 
         
     
+    except KeyboardInterrupt:
+        # Ctrl-C is a BaseException, so the generic handler below would miss
+        # it. Let finally zero the hardware and save the log, then propagate
+        # the abort.
+        print("\nCharge interrupted by user")
+        raise
     except Exception as e:
         print(f"\nException: {e}")
         traceback.print_exc()
         failed=True
     finally:
-        psu.CH1.set_output(False) # Disconnect the relay
+        # Disconnect the relay and zero the charger in one round-trip
         #psu.CH2.set_output(False)
-        psu.CH2.set_current(0) # Temporary workaround for the PSU leakage current issue
+        psu.write_many([
+            psu.CH1.cmd_set_output(False),
+            psu.CH2.cmd_set_current(0), # Temporary workaround for the PSU leakage current issue
+        ])
         print("\nFinally, PSU output zeroed. FIX ME: DISABLE PSU ONCE RELAY IS ADDED.")
-        # Log to a file
-        log_to_file(samples, fname)
+        # Flush any remaining rows to disk
+        logger.close()
         print(f"Saved data to {fname}")
 
         # Coulomb output
@@ -167,15 +315,33 @@ def discharge_cycle(load, fname):
     print("Starting discharge cycle...")
 
     failed=False
+    logger = CsvLogger(fname, Sample._fields)
+
+    # Local bindings for the hot loop (see charge_cycle)
+    _monotonic_ns = time.monotonic_ns
+    _sleep = time.sleep
+    ui_interval_ns = ui_update_interval * _NS_PER_S
 
     # Log the current and voltage at the start of the discharge cycle
-    start_time = time.time()
-    last_sample_time = start_time
-    samples = []
-    last_save_time = start_time
-    last_pulse_time = start_time
+    # (monotonic clock - see charge_cycle)
+    start_ns = _monotonic_ns()
+    last_sample_ns = start_ns
+    next_pulse_due_ns = start_ns + pulse_spacing * _NS_PER_S
     estimated_charge = 0
 
+    # Pulse state machine: rather than blocking in time.sleep while the pulse
+    # settles, stay in the 1 Hz loop so logging, coulomb counting and the
+    # cutoff check keep running. Settling is counted in whole ticks.
+    pulse_settling = False
+    pulse_ticks_remaining = 0
+    pre_pulse_voltage = 0.0
+
+    # Trailing window of recent voltages for the cutoff check, maintained
+    # incrementally so the check is O(1) per sample
+    cutoff_window = 20
+    volt_window = deque(maxlen=cutoff_window)
+    window_sum = 0.0
+
     try:
 
         progbar = tqdm.tqdm(total=spec.nominal_capacity_mah, unit="mAh", unit_scale=True, desc="Discharge starting...")
@@ -184,94 +350,130 @@ def discharge_cycle(load, fname):
         # Discharge at the nominal rate
         load.set_source_current(spec.discharge_current)
         load.set_source_state(True)
-        time.sleep(1)
+        _sleep(1)
+
+        next_tick_ns = _monotonic_ns() + _NS_PER_S
+        last_ui_update_ns = 0
+        consecutive_timeouts = 0
 
         while True:
 
             # Log the current and voltage
-            now = time.time()
-            dt = now - last_sample_time
-            last_sample_time = now
-            voltage = load.measure_voltage()
-            current = load.measure_current()
-            sample = {
-                'time': last_sample_time - start_time,
-                'voltage': voltage,
-                'current': current,
-                'charge': estimated_charge,
-                'resistance': '-', # Resistance calculation will be done during the pulse
-                'status': "discharge"
-            }
-            samples.append(sample)
-            
-            # Show a status line and progress bar in the console
-            charge_mah = coulombs_to_mah(estimated_charge)
-            progbar.n = min(charge_mah, spec.nominal_capacity_mah) # prevent the progress bar from going over the nominal capacity
-            progbar.set_description(f"Discharging: {current*1000:.1f}mA, {voltage:.3f}V, {charge_mah:.1f}mAh")
-
-
-            # Estimate charge based on the current and time. Trapezioidal rule would be more accurate but this is fine
+            now_ns = _monotonic_ns()
+            dt = (now_ns - last_sample_ns) * 1e-9 # Float delta is fine for coulomb counting
+            last_sample_ns = now_ns
+            # One compound query fetches voltage and current in a single round-trip
+            try:
+                voltage, current = load.measure_vi()
+                consecutive_timeouts = 0
+            except sdl1030x.TIMEOUT_ERRORS:
+                # A hung query shouldn't abort a multi-hour run: log the gap
+                # so post-processing can see it, and retry next tick - unless
+                # the link has been dead for several ticks running. The
+                # skipped ticks also skip the voltage-window update, so the
+                # cutoff check alone can't end a run with a dead link.
+                consecutive_timeouts += 1
+                if consecutive_timeouts >= max_consecutive_timeouts:
+                    raise
+                logger.append(Sample(time=(now_ns - start_ns) * 1e-9, voltage='-', current='-',
+                                     charge=estimated_charge, resistance='-', status="timeout"))
+                sleep_for = (next_tick_ns - _monotonic_ns()) * 1e-9
+                if sleep_for > 0:
+                    _sleep(sleep_for)
+                    next_tick_ns += _NS_PER_S
+                else:
+                    next_tick_ns = _monotonic_ns() + _NS_PER_S
+                continue
+
+            # Update the trailing voltage window
+            if len(volt_window) == cutoff_window:
+                window_sum -= volt_window[0]
+            volt_window.append(voltage)
+            window_sum += voltage
+
+            # Estimate charge based on the current and time. Integrating every
+            # tick from measured current also covers the pulses, instead of the
+            # old rectangle-rule guess over the settle period
             estimated_charge += current * dt
 
-            # When a pulse is due, log the current and voltage, increase to the pulse rate, measure the voltage again, and calculate the resistance
-            if time.time() - last_pulse_time > pulse_spacing:
-                last_pulse_time = time.time()
-
-                # Increase the current to the pulse rate
-                progbar.set_description(f"Discharge pulse: {pulse_discharge_current*1000:.1f}mA...")
-                load.set_source_current(pulse_discharge_current)
-
-                # Wait for the current to stabilise
-                time.sleep(pulse_settle_time)
-
-                # Measure the voltage and current
-                pulse_voltage = load.measure_voltage()
-                pulse_current = load.measure_current()
-
-                # Track the charge consumed during the pulse
-                estimated_charge += pulse_current * pulse_settle_time
-
-                # Calculate the internal resistance based on the voltage drop and the current increase
-                # Let's assume linear behaviour for now
-                # Vnominal = Vinternal - Inominal * Rinternal and Vpulse = Vinternal - Ipulse * Rinternal
-                # Rinternal = (Vnominal - Vpulse) / (Ipulse - Inominal)
-                resistance = (voltage - pulse_voltage) / (pulse_current - spec.discharge_current)
-                
-                pulse_sample = {
-                    'time': last_sample_time - start_time,
-                    'voltage': pulse_voltage,
-                    'current': pulse_current,
-                    'charge': estimated_charge,
-                    'resistance': resistance,
-                    'status': "discharge_pulse"
-                }
-                samples.append(pulse_sample)
-
-                # Return to the nominal discharge rate
-                load.set_source_current(spec.discharge_current)
-
-                # Prevent the coulomb counting from adding at the nominal rate for the duration of the pulse
-                last_sample_time = time.time()
-
-
-            # Once per minute, save the data to disk for later analysis
-            if time.time() - last_save_time > 60:
-                log_to_file(samples, fname)
-                last_save_time = time.time()
-
+            # Evaluate termination up front, before any pulse or UI work: a
+            # terminating tick should not start a new pulse on its way out.
             # If the average voltage over the last N samples has dropped below the termination voltage, terminate the discharge
             # This improves noise/pulse-loading immunity and makes the termination more predictable
-            num_samples_required = 20
-            if len(samples) >= num_samples_required and sum([sample['voltage'] for sample in samples[-num_samples_required:]]) / num_samples_required < spec.discharge_termination_voltage:
+            terminating = len(volt_window) == cutoff_window and window_sum / cutoff_window < spec.discharge_termination_voltage
+
+            status = "discharge"
+            resistance = '-' # Resistance calculation is only possible on a settled pulse
+
+            if terminating:
+                pass # Skip pulse handling; the loop exits after logging this sample
+            elif pulse_settling:
+                pulse_ticks_remaining -= 1
+                if pulse_ticks_remaining > 0:
+                    # Current still stabilising; log the transient so the
+                    # record stays continuous through the pulse
+                    status = "discharge_pulse_settle"
+                else:
+                    # Settled: this sample is the pulse measurement.
+                    # Calculate the internal resistance based on the voltage drop and the current increase
+                    # Let's assume linear behaviour for now
+                    # Vnominal = Vinternal - Inominal * Rinternal and Vpulse = Vinternal - Ipulse * Rinternal
+                    # Rinternal = (Vnominal - Vpulse) / (Ipulse - Inominal)
+                    resistance = (pre_pulse_voltage - voltage) / (current - spec.discharge_current)
+                    status = "discharge_pulse"
+
+                    # Return to the nominal discharge rate
+                    load.set_source_current(spec.discharge_current)
+                    pulse_settling = False
+                    next_pulse_due_ns = now_ns + pulse_spacing * _NS_PER_S
+            elif now_ns > next_pulse_due_ns:
+                # Start a pulse: this tick's sample was still at the nominal
+                # rate, so remember its voltage for the resistance calculation,
+                # raise the current, and keep sampling while it settles
+                pre_pulse_voltage = voltage
+                progbar.set_description(f"Discharge pulse: {pulse_discharge_current*1000:.1f}mA...")
+                load.set_source_current(pulse_discharge_current)
+                pulse_settling = True
+                pulse_ticks_remaining = pulse_settle_time # 1 Hz ticks, so ticks = seconds
+
+            sample = Sample(
+                time=(now_ns - start_ns) * 1e-9,
+                voltage=voltage,
+                current=current,
+                charge=estimated_charge,
+                resistance=resistance,
+                status=status
+            )
+            logger.append(sample)
+
+            if terminating:
                 print("\nDischarge terminated due to cutoff voltage")
                 break
 
-            # Run the update loop every second
-            delay = 1 - (time.time() - last_sample_time)
-            if delay > 0:
-                time.sleep(delay)
-            
-
+            # Show a status line and progress bar in the console
+            charge_mah = estimated_charge * _COULOMB_TO_MAH
+            progbar.n = min(charge_mah, spec.nominal_capacity_mah) # prevent the progress bar from going over the nominal capacity
+            if now_ns - last_ui_update_ns >= ui_interval_ns:
+                progbar.set_description(f"Discharging: {current*1000:.1f}mA, {voltage:.3f}V, {charge_mah:.1f}mAh", refresh=False)
+                progbar.refresh()
+                last_ui_update_ns = now_ns
+
+            # Run the update loop every second, scheduled against an absolute
+            # deadline so the cadence doesn't drift after a pulse or save
+            sleep_for = (next_tick_ns - _monotonic_ns()) * 1e-9
+            if sleep_for > 0:
+                _sleep(sleep_for)
+                next_tick_ns += _NS_PER_S
+            else:
+                # Fell behind (slow measurement, save or pulse): skip the
+                # missed ticks rather than bursting samples to catch up
+                next_tick_ns = _monotonic_ns() + _NS_PER_S
+
+
+    except KeyboardInterrupt:
+        # As in charge_cycle: clean up via finally, then propagate the abort
+        print("\nDischarge interrupted by user")
+        raise
     except Exception as e:
         print(f"\nException: {e}")
         traceback.print_exc()
@@ -284,13 +486,85 @@ def discharge_cycle(load, fname):
         # 
         print(f"Estimated charge this cycle: {coulombs_to_mah(estimated_charge)} mAh (coulombs: {estimated_charge})")
 
-        # Log to a file
-        log_to_file(samples, fname)
+        # Flush any remaining rows to disk
+        logger.close()
         print(f"Saved data to {fname}")
 
     return not failed
 
 
+def rest_with_logging(load, seconds, fname):
+    # Rest the battery between cycles. Rather than a blind time.sleep, keep
+    # sampling the (unloaded) battery voltage once per second - the rest period
+    # is exactly when open-circuit voltage recovery is measurable. Ctrl-C
+    # aborts the whole run, same as during a charge or discharge.
+    logger = CsvLogger(fname, Sample._fields)
+    progbar = tqdm.tqdm(total=seconds, unit="s", desc="Resting")
+
+    # Local bindings for the hot loop (see charge_cycle)
+    _monotonic_ns = time.monotonic_ns
+    _sleep = time.sleep
+
+    start_ns = _monotonic_ns()
+    end_ns = start_ns + seconds * _NS_PER_S
+    next_tick_ns = start_ns + _NS_PER_S
+
+    try:
+        while True:
+            now_ns = _monotonic_ns()
+            if now_ns >= end_ns:
+                break
+
+            elapsed = (now_ns - start_ns) * 1e-9
+            try:
+                voltage = load.measure_voltage()
+            except sdl1030x.TIMEOUT_ERRORS:
+                # A transient glitch shouldn't abort the whole run from a
+                # rest period (the load is off, so there's nothing to make
+                # safe): log the gap and retry next tick, as in the cycles
+                logger.append(Sample(time=elapsed, voltage='-', current=0.0,
+                                     charge=0.0, resistance='-', status="timeout"))
+                sleep_for = (next_tick_ns - _monotonic_ns()) * 1e-9
+                if sleep_for > 0:
+                    _sleep(sleep_for)
+                    next_tick_ns += _NS_PER_S
+                else:
+                    next_tick_ns = _monotonic_ns() + _NS_PER_S
+                continue
+            sample = Sample(
+                time=elapsed,
+                voltage=voltage,
+                current=0.0, # Load is off while resting
+                charge=0.0,
+                resistance='-',
+                status="rest"
+            )
+            logger.append(sample)
+
+            progbar.n = min(int(elapsed), seconds)
+            progbar.set_description(f"Resting: {voltage:.3f}V")
+
+            sleep_for = (next_tick_ns - _monotonic_ns()) * 1e-9
+            if sleep_for > 0:
+                _sleep(sleep_for)
+                next_tick_ns += _NS_PER_S
+            else:
+                # Fell behind (slow measurement, save or pulse): skip the
+                # missed ticks rather than bursting samples to catch up
+                next_tick_ns = _monotonic_ns() + _NS_PER_S
+
+    except KeyboardInterrupt:
+        # As in charge_cycle: clean up via finally, then propagate the abort.
+        # Swallowing Ctrl-C here would let the run roll on into the next
+        # cycle and re-energize the hardware unattended.
+        print("\nRest interrupted by user")
+        raise
+    finally:
+        progbar.close()
+        logger.close()
+        print(f"Saved rest data to {fname}")
+
+
 with dp8xx.DP8xx.ethernet_device(psu_ip) as psu, sdl1030x.SDL1030X.ethernet_device(load_ip) as load:
 
     # Estimate the total runtime as a rough guide
@@ -322,24 +596,27 @@ with dp8xx.DP8xx.ethernet_device(psu_ip) as psu, sdl1030x.SDL1030X.ethernet_devi
         f.write(f"Number of cycles: {number_of_cycles}\n")
         f.write(f"Rest time between charge and discharge: {rest_charge_to_discharge} s\n")
 
-    for cycle in range(1, number_of_cycles+1):
-        
-        print(f"Charge cycle {cycle}...")
-        if not charge_cycle(psu, f"{slug}_chg{cycle}_{identifier}.csv"):
-            print("Charge cycle failed!")
-            break
+    try:
+        for cycle in range(1, number_of_cycles+1):
 
-        print(f"Resting between charge and discharge...")
-        time.sleep(rest_charge_to_discharge)
-        
-        print(f"Discharge cycle {cycle}...")
-        if not discharge_cycle(load, f"{slug}_dis{cycle}_{identifier}.csv"):
-            print("Discharge cycle failed!")
-            break
+            print(f"Charge cycle {cycle}...")
+            if not charge_cycle(psu, f"{slug}_chg{cycle}_{identifier}.csv"):
+                print("Charge cycle failed!")
+                break
 
-        print(f"Resting between discharge and charge...")
-        time.sleep(rest_discharge_to_charge)
+            print(f"Resting between charge and discharge...")
+            rest_with_logging(load, rest_charge_to_discharge, f"{slug}_restchg{cycle}_{identifier}.csv")
+
+            print(f"Discharge cycle {cycle}...")
+            if not discharge_cycle(load, f"{slug}_dis{cycle}_{identifier}.csv"):
+                print("Discharge cycle failed!")
+                break
 
-    # Finally turn off all the hardware
-    psu.CH1.set_output(False)
-    psu.CH2.set_output(False)
+            print(f"Resting between discharge and charge...")
+            rest_with_logging(load, rest_discharge_to_charge, f"{slug}_restdis{cycle}_{identifier}.csv")
+
+    finally:
+        # Turn off all the hardware, however the run ended (including Ctrl-C)
+        psu.CH1.set_output(False)
+        psu.CH2.set_output(False)
+        load.set_source_state(False)
@@ -1,3 +1,4 @@
+import functools
 import pyvisa
 import numpy as np
 import time
@@ -11,6 +12,17 @@ logger = logging.getLogger("dp8xx")
 logger.addHandler(consoleHandler)
 logger.setLevel(logging.DEBUG)
 
+# Exceptions a caller can see if the instrument stops responding; callers that
+# prefer to skip a reading rather than abort can catch these
+TIMEOUT_ERRORS = (socket.timeout, vxi11.vxi11.Vxi11Exception, pyvisa.errors.VisaIOError)
+
+
+@functools.lru_cache(maxsize=16)
+def _resolve(host: str):
+    # Cache resolved addresses so reconnect/retry loops don't pay for a DNS
+    # lookup on every attempt
+    return socket.gethostbyname(host)
+
 
 class DP8xx(object):
     KNOWN_MODELS = [
@@ -22,48 +34,92 @@ class DP8xx(object):
     }
 
     @classmethod
-    def usb_device(cls, visa_rscr: str = None):
-        return USBDevice(visa_rscr)
+    def usb_device(cls, visa_rscr: str = None, inter_command_delay: float = 0.0):
+        return USBDevice(visa_rscr, inter_command_delay)
 
     @classmethod
     def ethernet_device(cls, host: str):
         return EthernetDevice(host)
 
+    def write_many(self, cmds):
+        # Compound SCPI: several commands joined with ';:' go out in a single
+        # write, so N settings cost one round-trip instead of N
+        self.write(";:".join(cmds))
+
+    def query_many(self, cmds):
+        # Query counterpart of write_many: one round-trip for several queries,
+        # with the replies returned ';'-separated in the same order
+        return self.query(";:".join(cmds)).split(";")
+
     class Channel(object):
         def __init__(self, chan_no: int, dev):
             self._name = f"CH{chan_no}"
             self._source_name = f"SOUR{chan_no}"
             self._dev = dev
+            # Precompute the command strings once; the methods then load an
+            # attribute instead of rebuilding an f-string on every call
+            self._cmd_outp_on = f"OUTP {self._name},ON"
+            self._cmd_outp_off = f"OUTP {self._name},OFF"
+
+        # The cmd_* builders return the SCPI string without sending it, so
+        # callers can batch several commands through write_many
+        def cmd_set_output(self, status: bool):
+            return self._cmd_outp_on if status else self._cmd_outp_off
 
         def set_output(self, status: bool):
-            self._dev.write(f"OUTP {self._name},{'ON' if status else 'OFF'}")
+            self._dev.write(self.cmd_set_output(status))
 
     class ControlledChannel(Channel):
+        def __init__(self, chan_no: int, dev):
+            super().__init__(chan_no, dev)
+            self._fmt_set_volt = f"{self._source_name}:VOLT {{:.3f}}"
+            self._fmt_set_curr = f"{self._source_name}:CURR {{:.3f}}"
+            self._cmd_get_volt = f"{self._source_name}:VOLT?"
+            self._cmd_get_curr = f"{self._source_name}:CURR?"
+            self._cmd_meas_volt = f"MEAS:VOLT? {self._name}"
+            self._cmd_meas_curr = f"MEAS:CURR? {self._name}"
+            self._cmd_meas_powe = f"MEAS:POWE? {self._name}"
+            self._cmd_meas_all = f"MEAS:ALL? {self._name}"
+
+        def cmd_set_voltage(self, voltage: float):
+            return self._fmt_set_volt.format(voltage)
+
+        def cmd_set_current(self, current: float):
+            return self._fmt_set_curr.format(current)
+
         def set_voltage(self, voltage: float):
-            self._dev.write(f"{self._source_name}:VOLT {voltage:.3f}")
+            self._dev.write(self.cmd_set_voltage(voltage))
 
         def set_current(self, current: float):
-            self._dev.write(f"{self._source_name}:CURR {current:.3f}")
+            self._dev.write(self.cmd_set_current(current))
 
         def get_voltage(self):
-            return self._dev.query(f"{self._source_name}:VOLT?")
+            return self._dev.query(self._cmd_get_volt)
 
         def get_current(self):
-            return self._dev.query(f"{self._source_name}:CURR?")
+            return self._dev.query(self._cmd_get_curr)
 
         def measure_voltage(self):
-            return self._dev.query(f"MEAS:VOLT? {self._name}")
+            return self._dev.query(self._cmd_meas_volt)
 
         def measure_current(self):
-            return self._dev.query(f"MEAS:CURR? {self._name}")
+            return self._dev.query(self._cmd_meas_curr)
 
         def measure_power(self):
-            return self._dev.query(f"MEAS:POWE? {self._name}")
-        
+            return self._dev.query(self._cmd_meas_powe)
+
+        def measure_all_tuple(self):
+            # Allocation-light variant for callers on a sampling loop:
+            # partition avoids building a list and the tuple result skips the
+            # per-call dict that measure_all creates
+            result = self._dev.query(self._cmd_meas_all)
+            v, _, rest = result.partition(",")
+            c, _, p = rest.partition(",")
+            return float(v), float(c), float(p)
+
         def measure_all(self):
-            result = self._dev.query(f"MEAS:ALL? {self._name}")
-            voltage, current, power = result.split(",")
-            return {'voltage': float(voltage), 'current': float(current), 'power': float(power)}
+            voltage, current, power = self.measure_all_tuple()
+            return {'voltage': voltage, 'current': current, 'power': power}
 
 
     def __enter__(self):
@@ -87,8 +143,12 @@ class DP8xx(object):
 
 
 class USBDevice(DP8xx):
-    def __init__(self, visa_rscr: str = None):
+    def __init__(self, visa_rscr: str = None, inter_command_delay: float = 0.0):
         self._visa_rscr = visa_rscr
+        # The VISA transport synchronises request/response, so no delay is
+        # needed between commands; keep an opt-in settle time for finicky
+        # instruments
+        self._inter_command_delay = inter_command_delay
 
     def __enter__(self):
         rm = pyvisa.ResourceManager("@py")
@@ -108,12 +168,14 @@ class USBDevice(DP8xx):
 
     def write(self, cmd: str):
         self._inst.write(cmd)
-        time.sleep(0.1)
+        if self._inter_command_delay:
+            time.sleep(self._inter_command_delay)
 
     def query(self, cmd: str):
         self.write(cmd)
         rep = self._inst.read()
-        time.sleep(0.1)
+        if self._inter_command_delay:
+            time.sleep(self._inter_command_delay)
         return rep
 
 
@@ -124,9 +186,12 @@ class EthernetDevice(DP8xx):
     def __enter__(self):
         try:
             logger.debug(f"Trying to resolve host {self._host}")
-            ip_addr = socket.gethostbyname(self._host)
+            ip_addr = _resolve(self._host)
         except socket.gaierror:
+            # Previously this was logged and swallowed, leaving ip_addr
+            # unbound; let the caller see the failure instead
             logger.error(f"Couldn't resolve host {self._host}")
+            raise
 
         self._inst = vxi11.Instrument(ip_addr)
         self._inst.timeout = 20 # seconds, default is 10s but some issues seen
@@ -1,93 +1,102 @@
-#!/usr/bin/env python3
-import csv
-import sys
-
-# Post-process the battery discharge data, to extract key parameters
-
-# We have a CSV file, with the following columns:
-# time	voltage	current	charge	resistance	status
-# Units are seconds, volts, amps, coulombs, ohms, and a string ("discharge" or "discharge_pulse")
-
-# Load the data from the named file
-fname = sys.argv[1]
-discharge_rate_amps = float(sys.argv[2])
-with open(fname, "r") as f:
-    reader = csv.DictReader(f)
-    # time, voltage, current, charge are all floats, parsed as such
-    # resistance is a float (for pulses) or "-" (for normal discharge)
-    # status is a string
-
-    # Convert the data to a list of dictionaries, parsing floats as we go
-    data = []
-    for row in reader:
-        row["time"] = float(row["time"])
-        row["voltage"] = float(row["voltage"])
-        row["current"] = float(row["current"])
-        row["charge"] = float(row["charge"])
-        if row["resistance"] != "-":
-            row["resistance"] = float(row["resistance"])
-        data.append(row)
-
-# First, split between discharge and discharge_pulse data
-discharge_data = [d for d in data if d["status"] == "discharge"]
-discharge_pulse_data = [d for d in data if d["status"] == "discharge_pulse"]
-
-#
-# Resistance calculation from pulse data
-#
-
-# Take an average of the resistance between the 30% and 70% time points and use that as our nominal resistance
-first_pulse_time = discharge_pulse_data[0]["time"]
-last_pulse_time = discharge_pulse_data[-1]["time"]
-
-# Find the 30% and 70% time points
-thirty_percent_time = first_pulse_time + 0.3 * (last_pulse_time - first_pulse_time)
-seventy_percent_time = first_pulse_time + 0.7 * (last_pulse_time - first_pulse_time)
-
-# Average the resistance between these two time points
-middle_samples = [d for d in discharge_pulse_data if thirty_percent_time < d["time"] < seventy_percent_time]
-resistances = [d["resistance"] for d in middle_samples]
-nominal_resistance = sum(resistances) / len(resistances)
-print(f"Measured resistance: {nominal_resistance}")
-
-
-#
-# Voltage - SOC curve
-#
-
-# From the normal discharge samples, the rate used for the discharge, we can calculate the open-circuit voltage for each sample
-ocvs = [x["voltage"] + x["current"] * nominal_resistance for x in discharge_data]
-
-# Take N evenly-spaced samples from the OCV data, and output as a C-style array
-N = 20
-
-indices = [int(i * (len(ocvs) - 1) / N) for i in range(N + 1)]
-
-# Sanity check: ensure we capture the entire range
-assert indices[0] == 0
-assert indices[-1] == len(ocvs) - 1
-
-ocv_samples = [ocvs[i] for i in indices]
-
-print("const float ocv_samples[] = {", end="")
-print(", ".join([f"{x:.4f}f" for x in ocv_samples[::-1]]), end="") # Reverse the order so that 0% SOC is at the start
-print("};")
-
-#
-# Capacity calculation
-#
-
-# Output the nominal capacity of the battery
-capacity_coulombs = data[-1]["charge"]
-capacity_mah = capacity_coulombs / 3600 * 1000
-print(f"Measured capacity: {capacity_mah:.1f} mAh.")
-
-# As a sanity check, we can calculate the capacity by taking the nominal discharge rate and multiplying by the time
-start_time = discharge_data[0]["time"]
-end_time = discharge_data[-1]["time"]
-sanity_check_coulombs = discharge_rate_amps * (end_time - start_time) # 1 coulomb = 1 ampere-second
-print(f"Sanity check capacity (under-estimate due to pulses): {sanity_check_coulombs / 3600 * 1000 :.1f} mAh.")
-
-
-
-
+#!/usr/bin/env python3
+import sys
+import numpy as np
+
+# Post-process the battery discharge data, to extract key parameters
+
+# We have a CSV file, with the following columns:
+# time	voltage	current	charge	resistance	status
+# Units are seconds, volts, amps, coulombs, ohms, and a string ("discharge" or "discharge_pulse")
+
+# Load the data from the named file
+fname = sys.argv[1]
+discharge_rate_amps = float(sys.argv[2])
+
+# Parse the whole file in one pass into a structured array, rather than
+# float()-converting each cell in a Python loop. The resistance column is "-"
+# for non-pulse rows (and voltage/current are "-" for timeout rows);
+# genfromtxt turns those into NaN.
+data = np.genfromtxt(fname, delimiter=",", skip_header=1,
+                     dtype=[("time", "f8"), ("voltage", "f8"), ("current", "f8"),
+                            ("charge", "f8"), ("resistance", "f8"), ("status", "U24")],
+                     missing_values="-", filling_values=np.nan)
+
+# Drop rows with no voltage reading (instrument timeouts leave gaps)
+data = data[~np.isnan(data["voltage"])]
+
+# First, split between discharge and discharge_pulse data. One read of the
+# status column feeds both vectorized comparisons; other statuses (pulse
+# settling, rest) are deliberately excluded from both groups.
+status = data["status"]
+discharge_data = data[status == "discharge"]
+discharge_pulse_data = data[status == "discharge_pulse"]
+
+#
+# Resistance calculation from pulse data
+#
+
+# A short or aborted run may contain no pulses at all, in which case there is
+# nothing to average
+if len(discharge_pulse_data) == 0:
+    sys.exit("No pulse data, cannot estimate resistance")
+
+# Take an average of the resistance between the 30% and 70% time points and use that as our nominal resistance
+pulse_times = discharge_pulse_data["time"]
+all_resistances = discharge_pulse_data["resistance"]
+
+if len(discharge_pulse_data) > 3:
+    first_pulse_time = pulse_times[0]
+    last_pulse_time = pulse_times[-1]
+
+    # Find the 30% and 70% time points
+    thirty_percent_time = first_pulse_time + 0.3 * (last_pulse_time - first_pulse_time)
+    seventy_percent_time = first_pulse_time + 0.7 * (last_pulse_time - first_pulse_time)
+
+    # Average the resistance between these two time points
+    middle_mask = (pulse_times > thirty_percent_time) & (pulse_times < seventy_percent_time)
+    resistances = all_resistances[middle_mask]
+    # Unevenly spaced pulses can leave the middle window empty; fall back to
+    # averaging everything rather than dividing by zero
+    nominal_resistance = resistances.mean() if len(resistances) else all_resistances.mean()
+else:
+    # Too few pulses to trim the ends meaningfully; just average what we have
+    nominal_resistance = all_resistances.mean()
+print(f"Measured resistance: {nominal_resistance}")
+
+
+#
+# Voltage - SOC curve
+#
+
+# From the normal discharge samples, the rate used for the discharge, we can calculate the open-circuit voltage for each sample
+ocvs = discharge_data["voltage"] + discharge_data["current"] * nominal_resistance
+
+# Take N evenly-spaced samples from the OCV data, and output as a C-style array
+N = 20
+
+indices = np.linspace(0, len(ocvs) - 1, N + 1).astype(int)
+
+# Sanity check: ensure we capture the entire range
+assert indices[0] == 0
+assert indices[-1] == len(ocvs) - 1
+
+ocv_samples = ocvs[indices]
+
+print("const float ocv_samples[] = {", end="")
+print(", ".join([f"{x:.4f}f" for x in ocv_samples[::-1]]), end="") # Reverse the order so that 0% SOC is at the start
+print("};")
+
+#
+# Capacity calculation
+#
+
+# Output the nominal capacity of the battery
+capacity_coulombs = data["charge"][-1]
+capacity_mah = capacity_coulombs / 3600 * 1000
+print(f"Measured capacity: {capacity_mah:.1f} mAh.")
+
+# As a sanity check, we can calculate the capacity by taking the nominal discharge rate and multiplying by the time
+start_time = discharge_data["time"][0]
+end_time = discharge_data["time"][-1]
+sanity_check_coulombs = discharge_rate_amps * (end_time - start_time) # 1 coulomb = 1 ampere-second
+print(f"Sanity check capacity (under-estimate due to pulses): {sanity_check_coulombs / 3600 * 1000 :.1f} mAh.")
@@ -1,5 +1,7 @@
+import functools
 import pyvisa
 import numpy as np
+import threading
 import time
 import xdrlib
 import logging
@@ -11,39 +13,67 @@ logger = logging.getLogger("sdl1030x")
 logger.addHandler(consoleHandler)
 logger.setLevel(logging.DEBUG)
 
+# Exceptions a caller can see if the instrument stops responding; callers that
+# prefer to skip a reading rather than abort can catch these
+TIMEOUT_ERRORS = (socket.timeout, vxi11.vxi11.Vxi11Exception, pyvisa.errors.VisaIOError)
+
+
+@functools.lru_cache(maxsize=16)
+def _resolve(host: str):
+    # Cache resolved addresses so reconnect/retry loops don't pay for a DNS
+    # lookup on every attempt
+    return socket.gethostbyname(host)
+
 
 class SDL1030X(object):
 
     KNOWN_MODELS = ["SDL1030X"]
 
     @classmethod
-    def usb_device(cls, visa_rscr: str = None):
-        return USBDevice(visa_rscr)
+    def usb_device(cls, visa_rscr: str = None, inter_command_delay: float = 0.0):
+        return USBDevice(visa_rscr, inter_command_delay)
 
     @classmethod
-    def ethernet_device(cls, host: str):
-        return EthernetDevice(host)
+    def ethernet_device(cls, host: str, inter_command_delay: float = 0.0):
+        return EthernetDevice(host, inter_command_delay)
+
+    def write_sync(self, cmd):
+        # For commands that take effect slowly (e.g. toggling the input),
+        # block until the instrument reports the operation complete
+        self.write(cmd)
+        self.query("*OPC?")
     
     def measure_voltage(self):
-        return float(self.query(f"MEAS:VOLT:DC?"))
+        return float(self.query("MEAS:VOLT:DC?"))
 
     def measure_current(self):
-        return float(self.query(f"MEAS:CURR:DC?"))
+        return float(self.query("MEAS:CURR:DC?"))
     
     def measure_power(self):
-        return float(self.query(f"MEAS:POW:DC?"))
+        return float(self.query("MEAS:POW:DC?"))
     
     def measure_resistance(self):
-        return float(self.query(f"MEAS:RES:DC?"))
+        return float(self.query("MEAS:RES:DC?"))
     
     def measure_external(self):
-        return float(self.query(f"MEAS:EXT?"))
+        return float(self.query("MEAS:EXT?"))
+
+    def measure_vi(self):
+        # Compound SCPI query: voltage and current in one round-trip instead
+        # of two. Falls back to separate queries if the device doesn't
+        # support the ';' command separator.
+        reply = self.query("MEAS:VOLT:DC?;:MEAS:CURR:DC?")
+        try:
+            v, c = reply.split(";")
+            return float(v), float(c)
+        except ValueError:
+            return self.measure_voltage(), self.measure_current()
     
     def set_source_state(self, enabled):
-        self.write(f"SOUR:INP:STAT {1 if enabled else 0}")
+        self.write_sync(f"SOUR:INP:STAT {1 if enabled else 0}")
 
     def get_source_state(self):
-        return bool(self.query(f"SOUR:INP:STAT?"))
+        return bool(self.query("SOUR:INP:STAT?"))
     
     def set_source_mode(self, mode):
         modes = ["CC", "CV", "CP", "CR", "LED"]
@@ -52,7 +82,7 @@ class SDL1030X(object):
 
     def get_source_mode(self):
         # Will return one of "CURRENT", "VOLTAGE", "POWER", "RESISTANCE", "LED"
-        return self.query(f"SOUR:FUNC?")
+        return self.query("SOUR:FUNC?")
     
     def set_source_current(self, current):
 
@@ -65,7 +95,7 @@ class SDL1030X(object):
         self.write(f"SOUR:CURR:LEV:IMM {current}")
 
     def get_source_current(self):
-        return float(self.query(f"SOUR:CURR:LEV:IMM?"))
+        return float(self.query("SOUR:CURR:LEV:IMM?"))
     
     def set_source_voltage(self, voltage):
         if voltage < 0:
@@ -77,7 +107,7 @@ class SDL1030X(object):
         self.write(f"SOUR:VOLT:LEV:IMM {voltage}")
 
     def get_source_voltage(self):
-        return float(self.query(f"SOUR:VOLT:LEV:IMM?"))
+        return float(self.query("SOUR:VOLT:LEV:IMM?"))
     
 
 
@@ -100,8 +130,13 @@ class SDL1030X(object):
 
 
 class USBDevice(SDL1030X):
-    def __init__(self, visa_rscr: str = None):
+    def __init__(self, visa_rscr: str = None, inter_command_delay: float = 0.0):
         self._visa_rscr = visa_rscr
+        # The transport synchronises request/response, so no delay is needed
+        # between commands; keep an opt-in settle time for finicky instruments
+        self._inter_command_delay = inter_command_delay
+        # Serialise access so the device can be used from worker threads
+        self._lock = threading.RLock()
 
     def __enter__(self):
         rm = pyvisa.ResourceManager("@py")
@@ -120,33 +155,47 @@ class USBDevice(SDL1030X):
         return super().__enter__()
 
     def write(self, cmd: str):
-        self._inst.write(cmd)
-        time.sleep(0.1)
+        with self._lock:
+            self._inst.write(cmd)
+            if self._inter_command_delay:
+                time.sleep(self._inter_command_delay)
 
     def query(self, cmd: str):
-        self.write(cmd)
-        rep = self._inst.read()
-        time.sleep(0.1)
-        return rep
+        with self._lock:
+            self.write(cmd)
+            rep = self._inst.read()
+            if self._inter_command_delay:
+                time.sleep(self._inter_command_delay)
+            return rep
 
 
 class EthernetDevice(SDL1030X):
-    def __init__(self, host: str):
+    def __init__(self, host: str, inter_command_delay: float = 0.0):
         self._host = host
+        self._inter_command_delay = inter_command_delay
+        # Serialise access so the device can be used from worker threads
+        self._lock = threading.RLock()
 
     def __enter__(self):
         try:
             logger.debug(f"Trying to resolve host {self._host}")
-            ip_addr = socket.gethostbyname(self._host)
+            ip_addr = _resolve(self._host)
         except socket.gaierror:
+            # Previously this was logged and swallowed, leaving ip_addr
+            # unbound; let the caller see the failure instead
             logger.error(f"Couldn't resolve host {self._host}")
+            raise
 
         self._inst = vxi11.Instrument(ip_addr)
+        self._inst.timeout = 20 # seconds, default is 10s but some issues seen
         return super().__enter__()
 
     def write(self, cmd: str):
-        self._inst.write(cmd)
-        time.sleep(0.1)
+        with self._lock:
+            self._inst.write(cmd)
+            if self._inter_command_delay:
+                time.sleep(self._inter_command_delay)
 
     def query(self, cmd: str):
-        return self._inst.ask(cmd)
\ No newline at end of file
+        with self._lock:
+            return self._inst.ask(cmd)
\ No newline at end of file